@@ -1,36 +1,161 @@
-from flask import Flask, request, jsonify, send_from_directory, abort
+from flask import Flask, Response, request, jsonify, send_from_directory, abort
+from flask.json.provider import JSONProvider
+from cachetools import TTLCache
 from flask_cors import CORS
-import json
+from whitenoise import WhiteNoise
+import orjson
+import copy
+import fcntl
+import functools
 import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+class OrjsonProvider(JSONProvider):
+    """orjson-backed JSON provider so jsonify uses the C encoder"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+Flask.json_provider_class = OrjsonProvider
 app = Flask(__name__, static_folder='static')
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 86400
 CORS(app)
 
+# 静态资源交给 WhiteNoise：启动时缓存文件元数据，请求不再进 Flask 路由
+app.wsgi_app = WhiteNoise(
+    app.wsgi_app,
+    root=os.path.join(os.path.dirname(__file__), 'static'),
+    max_age=86400,
+)
+
+# 启动时把首页读进内存，请求时不再走文件系统
+try:
+    with open(os.path.join(os.path.dirname(__file__), 'static', 'index.html'), 'rb') as f:
+        _INDEX_HTML = f.read()
+except OSError:
+    _INDEX_HTML = None
+
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
-STATS_CACHE = {}  # Cache for monthly stats: {(year, month): stats}
+# Cache for monthly stats: {(year, month): encoded bytes}, bounded + TTL so it
+# can't grow forever and is safe to mutate from gthread workers
+STATS_CACHE = TTLCache(maxsize=256, ttl=3600)
+_STATS_LOCK = threading.Lock()
+
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
 
-DATE_FORMAT = '%Y-%m-%d'
+# Parsed-file cache: path -> (mtime_ns, size, parsed dict), LRU-evicted
+_FILE_CACHE_MAX = 1024
+_FILE_CACHE = OrderedDict()
+_FILE_CACHE_LOCK = threading.Lock()
 
+def _store_file_cache(path, key, data):
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE[path] = (key[0], key[1], copy.deepcopy(data))
+        _FILE_CACHE.move_to_end(path)
+        while len(_FILE_CACHE) > _FILE_CACHE_MAX:
+            _FILE_CACHE.popitem(last=False)
+
+def _load_json_cached(path):
+    """读取并解析 JSON 文件，文件未变化时直接命中内存缓存"""
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    with _FILE_CACHE_LOCK:
+        cached = _FILE_CACHE.get(path)
+        if cached and (cached[0], cached[1]) == key:
+            _FILE_CACHE.move_to_end(path)
+            return copy.deepcopy(cached[2])
+    with open(path, 'rb') as f:
+        data = orjson.loads(f.read())
+    _store_file_cache(path, key, data)
+    return data
+
+@functools.lru_cache(maxsize=4096)
 def parse_date(date_str):
+    # 先用正则挡掉格式错误的输入，合法格式直接构造 datetime，不走 strptime
+    if not _DATE_RE.match(date_str):
+        return None
     try:
-        return datetime.strptime(date_str, DATE_FORMAT)
+        return datetime(int(date_str[:4]), int(date_str[5:7]), int(date_str[8:10]))
     except ValueError:
         return None
 
-def get_data_path(date_str):
-    """获取指定日期的数据文件路径"""
+# 已创建过的月目录，避免每个请求都走 makedirs
+_ENSURED_DIRS = set()
+_ENSURED_DIRS_LOCK = threading.Lock()
+
+def _compute_data_path(date_str):
+    """计算指定日期的数据文件路径（不创建目录）"""
     date = parse_date(date_str)
     if not date:
         return None
     year_dir = os.path.join(DATA_DIR, str(date.year))
     month_dir = os.path.join(year_dir, f'{date.month:02d}')
-    os.makedirs(month_dir, exist_ok=True)
     return os.path.join(month_dir, f'{date.day:02d}.json')
 
+def get_data_path(date_str):
+    """获取指定日期的数据文件路径，确保月目录存在"""
+    path = _compute_data_path(date_str)
+    if not path:
+        return None
+    month_dir = os.path.dirname(path)
+    if month_dir not in _ENSURED_DIRS:
+        os.makedirs(month_dir, exist_ok=True)
+        with _ENSURED_DIRS_LOCK:
+            _ENSURED_DIRS.add(month_dir)
+    return path
+
+def _atomic_write(path, payload):
+    """先写临时文件再 os.replace，避免读到截断/半写的文件。
+
+    临时文件名用 mkstemp 生成，保证并发写同一日期时各写各的，
+    不会互相截断或 replace 掉对方没写完的内容。
+    """
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+# “该日期还没有文件”的短时负缓存，避免新日期请求反复扫目录
+_NEG_CACHE = OrderedDict()
+_NEG_CACHE_TTL = 5.0
+_NEG_CACHE_MAX = 1024
+_NEG_CACHE_LOCK = threading.Lock()
+
+def _neg_cache_get(date_str):
+    with _NEG_CACHE_LOCK:
+        return _NEG_CACHE.get(date_str)
+
+def _neg_cache_add(date_str):
+    now = time.monotonic()
+    with _NEG_CACHE_LOCK:
+        _NEG_CACHE[date_str] = now
+        _NEG_CACHE.move_to_end(date_str)
+        if len(_NEG_CACHE) > _NEG_CACHE_MAX:
+            for key in [k for k, ts in _NEG_CACHE.items() if now - ts >= _NEG_CACHE_TTL]:
+                del _NEG_CACHE[key]
+            # 没有过期条目可清时按插入序淘汰，让上限是硬上限
+            while len(_NEG_CACHE) > _NEG_CACHE_MAX:
+                _NEG_CACHE.popitem(last=False)
+
 def find_task_file(date_str):
     """尝试找到与日期匹配的数据文件（兼容文件名与内容日期不一致的情况）"""
-    canonical_path = get_data_path(date_str)
+    canonical_path = _compute_data_path(date_str)
     if canonical_path and os.path.exists(canonical_path):
         return canonical_path, canonical_path
 
@@ -38,44 +163,86 @@ def find_task_file(date_str):
     if not parsed:
         return None, canonical_path
 
+    cached_at = _neg_cache_get(date_str)
+    if cached_at is not None and time.monotonic() - cached_at < _NEG_CACHE_TTL:
+        return None, canonical_path
+
     month_dir = os.path.join(DATA_DIR, str(parsed.year), f'{parsed.month:02d}')
     if not os.path.exists(month_dir):
+        _neg_cache_add(date_str)
         return None, canonical_path
 
-    for filename in os.listdir(month_dir):
-        if not filename.endswith('.json'):
-            continue
-        candidate_path = os.path.join(month_dir, filename)
-        try:
-            with open(candidate_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            if data.get('date') == date_str:
-                return candidate_path, canonical_path
-        except (OSError, json.JSONDecodeError):
-            continue
+    # 扫整月目录找内容日期匹配的旧文件；启动迁移后这里几乎只在冷启动走到
+    with os.scandir(month_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json') or entry.name.startswith('.'):
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                data = _load_json_cached(entry.path)
+                if data.get('date') == date_str:
+                    return entry.path, canonical_path
+            except (OSError, ValueError):
+                continue
 
+    _neg_cache_add(date_str)
     return None, canonical_path
 
-def load_tasks(date_str, auto_save=True):
+# 按日期的写通内存存储，条目记录落盘文件的 (mtime_ns, size)，
+# 多 worker 下靠它发现别的进程写过文件；LRU 限容同 _FILE_CACHE
+_TASKS_MAX = 1024
+_TASKS = OrderedDict()
+_TASKS_LOCK = threading.RLock()
+
+# 按日期分片的锁，让同一天的“读-改-写”在线程间互斥
+_DATE_LOCKS = [threading.RLock() for _ in range(64)]
+
+def _date_lock(date_str):
+    return _DATE_LOCKS[hash(date_str) % len(_DATE_LOCKS)]
+
+def _store_tasks(date_str, key, data):
+    with _TASKS_LOCK:
+        _TASKS[date_str] = (key, copy.deepcopy(data))
+        _TASKS.move_to_end(date_str)
+        while len(_TASKS) > _TASKS_MAX:
+            _TASKS.popitem(last=False)
+
+def _file_key(path):
+    """文件的 (mtime_ns, size)，不存在时为 None"""
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def load_tasks(date_str):
     """加载指定日期的任务"""
+    canonical = _compute_data_path(date_str)
+    with _TASKS_LOCK:
+        cached = _TASKS.get(date_str)
+        if cached is not None:
+            key, cached_data = cached
+            if _file_key(canonical) == key:
+                _TASKS.move_to_end(date_str)
+                data = copy.deepcopy(cached_data)
+                data['_index'] = {t['id']: i for i, t in enumerate(data['tasks']) if 'id' in t}
+                return data
+            del _TASKS[date_str]
+
     path, canonical_path = find_task_file(date_str)
 
     if path and os.path.exists(path):
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = _load_json_cached(path)
         data['date'] = date_str
-
-        # 兼容旧路径
-        if canonical_path and path != canonical_path:
-            save_tasks(date_str, data)
-            try:
-                os.remove(path)
-            except OSError:
-                pass
     else:
         # 新日期，返回空任务列表，不自动迁移
         data = {'date': date_str, 'tasks': []}
 
+    # 日期非法（canonical 为 None）时不入缓存，避免被垃圾输入撑大
+    if canonical is not None:
+        _store_tasks(date_str, _file_key(canonical), data)
+    data['_index'] = {t['id']: i for i, t in enumerate(data['tasks']) if 'id' in t}
     return data
 
 def invalidate_stats_cache(date_str):
@@ -83,19 +250,86 @@ def invalidate_stats_cache(date_str):
     parsed = parse_date(date_str)
     if parsed:
         key = (str(parsed.year), f'{parsed.month:02d}')
-        if key in STATS_CACHE:
-            del STATS_CACHE[key]
+        with _STATS_LOCK:
+            STATS_CACHE.pop(key, None)
 
 def save_tasks(date_str, data):
     """保存任务到文件"""
     path = get_data_path(date_str)
     if path:
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        data.pop('_index', None)
+        # 落盘时顺手保存聚合值，月度统计就不用重数任务了
+        tasks = data.get('tasks', [])
+        data['_total'] = len(tasks)
+        data['_completed'] = sum(1 for t in tasks if t.get('completed'))
+        _atomic_write(path, orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
+        try:
+            st = os.stat(path)
+            key = (st.st_mtime_ns, st.st_size)
+            _store_file_cache(path, key, data)
+            _store_tasks(date_str, key, data)
+        except OSError:
+            pass
+        with _NEG_CACHE_LOCK:
+            _NEG_CACHE.pop(date_str, None)
         invalidate_stats_cache(date_str)
         return True
     return False
 
+def _migrate_one(path, data, date_str, canonical_path):
+    """把单个旧文件搬到/并入规范路径，成功后删除旧文件"""
+    with _date_lock(date_str):
+        if os.path.exists(canonical_path):
+            # 规范文件已存在（迁移前就有人写过这一天）：合并任务，不丢数据
+            try:
+                with open(canonical_path, 'rb') as f:
+                    canonical_data = orjson.loads(f.read())
+            except (OSError, ValueError):
+                return
+            existing_ids = {t.get('id') for t in canonical_data.get('tasks', [])}
+            missing = [t for t in data.get('tasks', []) if t.get('id') not in existing_ids]
+            if missing:
+                canonical_data.setdefault('tasks', []).extend(missing)
+                if not save_tasks(date_str, canonical_data):
+                    return
+        elif not save_tasks(date_str, data):
+            return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def migrate_legacy_files():
+    """启动时（开始服务前）把文件名与内容日期不一致的旧文件迁移到规范路径。
+
+    多个 worker 会各自调用一次，靠 DATA_DIR 下的 flock 互斥；
+    后到的 worker 拿到锁时已无事可做。
+    """
+    if not os.path.isdir(DATA_DIR):
+        return
+    lock_path = os.path.join(DATA_DIR, '.migrate.lock')
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        for dirpath, _dirnames, filenames in os.walk(DATA_DIR):
+            for filename in filenames:
+                if not filename.endswith('.json') or filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    with open(path, 'rb') as f:
+                        data = orjson.loads(f.read())
+                except (OSError, ValueError):
+                    continue
+                date_str = data.get('date')
+                canonical_path = _compute_data_path(date_str) if date_str else None
+                if not canonical_path or canonical_path == path:
+                    continue
+                _migrate_one(path, data, date_str, canonical_path)
+
+def _public(data):
+    """剥离下划线开头的内部字段，返回可对外的数据"""
+    return {k: v for k, v in data.items() if not k.startswith('_')}
+
 def validate_task(task):
     """Validate task data"""
     content = task.get('content', '').strip()
@@ -112,17 +346,46 @@ def validate_task(task):
 
 @app.route('/')
 def index():
+    if _INDEX_HTML is not None:
+        return Response(_INDEX_HTML, mimetype='text/html')
     return send_from_directory('static', 'index.html')
 
-@app.route('/<path:path>')
-def serve_static(path):
-    return send_from_directory('static', path)
-
 @app.route('/api/tasks/<date_str>', methods=['GET'])
 def get_tasks(date_str):
-    """获取指定日期的任务列表"""
+    """获取指定日期的任务列表，支持 ?offset=&limit= 分页"""
+    try:
+        limit = int(request.args.get('limit', 500))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid pagination params'}), 400
+    if limit < 0 or offset < 0:
+        return jsonify({'error': 'Invalid pagination params'}), 400
+    limit = min(limit, 1000)
+
+    # 基于文件 mtime 的 ETag，让客户端条件请求直接拿 304
+    etag = None
+    path = _compute_data_path(date_str)
+    if path:
+        try:
+            st = os.stat(path)
+            etag = f'{st.st_mtime_ns:x}-{st.st_size:x}'
+        except OSError:
+            pass
+    if etag and etag in request.if_none_match:
+        # RFC 7232: 304 也要带上 200 会带的校验头
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
     data = load_tasks(date_str)
-    return jsonify(data)
+    body = _public(data)
+    tasks = body.get('tasks', [])
+    body['total'] = len(tasks)
+    body['tasks'] = tasks[offset:offset + limit]
+    response = jsonify(body)
+    if etag:
+        response.set_etag(etag)
+    return response
 
 @app.route('/api/tasks/<date_str>', methods=['POST'])
 def add_task(date_str):
@@ -132,12 +395,13 @@ def add_task(date_str):
     if error:
         return jsonify({'error': error}), 400
 
-    data = load_tasks(date_str)
-    task['id'] = datetime.now().strftime('%Y%m%d%H%M%S%f')
-    task['completed'] = False
-    task['createdAt'] = datetime.now().isoformat()
-    data['tasks'].append(task)
-    save_tasks(date_str, data)
+    with _date_lock(date_str):
+        data = load_tasks(date_str)
+        task['id'] = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        task['completed'] = False
+        task['createdAt'] = datetime.now().isoformat()
+        data['tasks'].append(task)
+        save_tasks(date_str, data)
     return jsonify(task), 201
 
 @app.route('/api/tasks/<date_str>/<task_id>', methods=['PUT'])
@@ -157,61 +421,97 @@ def update_task(date_str, task_id):
         if 'priority' in updates and updates['priority'] not in ['normal', 'important', 'urgent']:
              return jsonify({'error': 'Invalid priority'}), 400
 
-    data = load_tasks(date_str)
-    for task in data['tasks']:
-        if task['id'] == task_id:
-            task.update(updates)
-            save_tasks(date_str, data)
-            return jsonify(task)
-    return jsonify({'error': 'Task not found'}), 404
+    with _date_lock(date_str):
+        data = load_tasks(date_str)
+        index = data.get('_index', {}).get(task_id)
+        if index is None:
+            return jsonify({'error': 'Task not found'}), 404
+        task = data['tasks'][index]
+        task.update(updates)
+        save_tasks(date_str, data)
+    return jsonify(task)
 
 @app.route('/api/tasks/<date_str>/<task_id>', methods=['DELETE'])
 def delete_task(date_str, task_id):
     """删除任务"""
-    data = load_tasks(date_str)
-    original_len = len(data['tasks'])
-    data['tasks'] = [t for t in data['tasks'] if t['id'] != task_id]
-    if len(data['tasks']) < original_len:
+    with _date_lock(date_str):
+        data = load_tasks(date_str)
+        index = data.get('_index', {}).get(task_id)
+        if index is None:
+            return jsonify({'error': 'Task not found'}), 404
+        data['tasks'].pop(index)
         save_tasks(date_str, data)
-        return jsonify({'success': True})
-    return jsonify({'error': 'Task not found'}), 404
+    return jsonify({'success': True})
 
 @app.route('/api/stats/<year>/<month>', methods=['GET'])
 def get_monthly_stats(year, month):
     """获取月度统计"""
+    month_dir = os.path.join(DATA_DIR, year, month)
+    # 目录 mtime 做缓存校验：别的 worker 替换过当月文件时目录必然变动，
+    # 进程内的 invalidate 之外还能发现跨进程的写
+    try:
+        dir_key = os.stat(month_dir).st_mtime_ns
+    except OSError:
+        dir_key = None
+
     cache_key = (year, month)
-    if cache_key in STATS_CACHE:
-        return jsonify(STATS_CACHE[cache_key])
+    with _STATS_LOCK:
+        cached = STATS_CACHE.get(cache_key)
+    if cached is not None and cached[0] == dir_key:
+        # 缓存的是编码好的字节串，命中时不再过 jsonify
+        return Response(cached[1], mimetype='application/json')
 
-    month_dir = os.path.join(DATA_DIR, year, month)
     stats = {'days': {}, 'totalTasks': 0, 'completedTasks': 0}
     
+    def read_day(day_file):
+        name, path = day_file
+        try:
+            data = _load_json_cached(path)
+        except (OSError, ValueError):
+            return None
+
+        # Determine day from date field or filename
+        day = name.replace('.json', '')
+        data_date = data.get('date')
+        parsed = parse_date(data_date) if data_date else None
+        if parsed and str(parsed.year) == year and f'{parsed.month:02d}' == month:
+            day = f'{parsed.day:02d}'
+
+        total = data.get('_total')
+        completed = data.get('_completed')
+        if total is None or completed is None:
+            # 旧文件没有聚合字段，退回逐条统计
+            total = len(data.get('tasks', []))
+            completed = sum(1 for t in data.get('tasks', []) if t.get('completed'))
+        return day, total, completed
+
     if os.path.exists(month_dir):
-        for filename in os.listdir(month_dir):
-            if filename.endswith('.json'):
-                try:
-                    with open(os.path.join(month_dir, filename), 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    # Determine day from date field or filename
-                    day = filename.replace('.json', '')
-                    data_date = data.get('date')
-                    parsed = parse_date(data_date) if data_date else None
-                    if parsed and str(parsed.year) == year and f'{parsed.month:02d}' == month:
-                        day = f'{parsed.day:02d}'
-                    
-                    total = len(data.get('tasks', []))
-                    completed = sum(1 for t in data.get('tasks', []) if t.get('completed'))
+        with os.scandir(month_dir) as entries:
+            day_files = [(entry.name, entry.path) for entry in entries
+                         if entry.name.endswith('.json')
+                         and not entry.name.startswith('.')
+                         and entry.is_file(follow_symlinks=False)]
+
+        if day_files:
+            # 线程在文件 I/O 上会释放 GIL，并行读整月的文件
+            with ThreadPoolExecutor(max_workers=min(8, len(day_files))) as executor:
+                for result in executor.map(read_day, day_files):
+                    if result is None:
+                        continue
+                    day, total, completed = result
                     stats['days'][day] = {'total': total, 'completed': completed}
                     stats['totalTasks'] += total
                     stats['completedTasks'] += completed
-                except (OSError, json.JSONDecodeError):
-                    continue
-    
-    STATS_CACHE[cache_key] = stats
-    return jsonify(stats)
+
+
+    encoded = orjson.dumps(stats)
+    with _STATS_LOCK:
+        STATS_CACHE[cache_key] = (dir_key, encoded)
+    return Response(encoded, mimetype='application/json')
 
 if __name__ == '__main__':
     os.makedirs(DATA_DIR, exist_ok=True)
+    migrate_legacy_files()
     print('🗓️  每日计划表已启动: http://localhost:5001')
-    app.run(debug=True, port=5001)
+    # 仅本地开发入口；生产走 wsgi.py + gunicorn
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', port=5001)
@@ -0,0 +1,17 @@
+"""生产入口: gunicorn --worker-class=gthread --workers=4 --threads=8 wsgi:app"""
+import os
+import resource
+
+from app import app, migrate_legacy_files, DATA_DIR
+
+# 多 worker × 多线程并发打开文件，尽量把描述符上限提到 hard limit
+try:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+except (OSError, ValueError):
+    pass
+
+os.makedirs(DATA_DIR, exist_ok=True)
+# 数据量很小，开始服务前同步迁移完；worker 间由函数内的 flock 互斥
+migrate_legacy_files()